@@ -38,21 +38,144 @@
 
 
 import contextlib
+import functools
 import importlib
 import logging
+import re
 import threading
 import sqlite3
 import sys
+import time
+import types
 from abc import abstractmethod
+from typing import Callable, Optional
 from gevent.local import local
+from gevent.queue import Empty, Full, Queue
+from gevent.threadpool import ThreadPool
 
 from volttron import utils
 from volttron.utils import jsonapi
 
+# orjson is optional. Without it every value is serialized with jsonapi
+_orjson_dumps: Optional[Callable[..., bytes]] = None
+_ORJSON_OPTIONS = 0
+try:
+    import orjson
+    _orjson_dumps = orjson.dumps
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+except ImportError:
+    pass
+
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
 
+def _encode(value):
+    """
+    Serialize a value to a json string with orjson when it is installed, else with jsonapi.dumps. orjson writes
+    NaN and Infinity as null and non ASCII characters unescaped, so any value whose orjson output contains null or
+    non ASCII bytes, and any value orjson cannot encode (for example integers beyond 64 bits), goes through
+    jsonapi.dumps instead. The stored json then decodes to the same value with either encoder.
+    :param value: value to serialize
+    :return: json string
+    """
+    if _orjson_dumps is not None:
+        try:
+            encoded = _orjson_dumps(value, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+        else:
+            if b'null' not in encoded and encoded.isascii():
+                return encoded.decode()
+    return jsonapi.dumps(value)
+
+
+# Cache serializations of repeated scalar values (status flags, enumerations, strings). typed=True keeps 1 and True
+# apart. Floats are left out because sensor readings rarely repeat and would only churn the cache.
+_dumps_scalar = functools.lru_cache(maxsize=4096, typed=True)(_encode)
+_CACHED_TYPES = (int, str, type(None))
+
+
+def _dumps(value):
+    """
+    Serialize a value with _encode, reusing the result for repeated hashable scalars
+    :param value: value to serialize
+    :return: json string
+    """
+    if isinstance(value, _CACHED_TYPES):
+        return _dumps_scalar(value)
+    return _encode(value)
+
+
+# the parenthesized row of placeholders of an INSERT ... VALUES (...) statement
+_VALUES_ROW = re.compile(r'\bVALUES\s*(\([^()]*\))', re.IGNORECASE)
+# rows sent with one multi row statement by _execute_values
+_VALUES_PAGE_SIZE = 1000
+
+
+def _executemany(cursor, stmt, args):
+    cursor.executemany(stmt, args)
+    return cursor.rowcount
+
+
+def _execute_values(cursor, stmt, args):
+    """
+    executemany for psycopg2. Sends the rows of an INSERT ... VALUES (...) statement as multi row statements through
+    psycopg2.extras.execute_values, which is much faster than psycopg2's executemany. Other statements fall back to
+    executemany.
+    :return: count of the rows affected by all the statements
+    """
+    from psycopg2.extras import execute_values
+    if not isinstance(stmt, str):
+        # statements built with psycopg2.sql are Composable objects
+        as_string = getattr(stmt, 'as_string', None)
+        if as_string is None:
+            return _executemany(cursor, stmt, args)
+        stmt = as_string(cursor)
+    match = _VALUES_ROW.search(stmt)
+    if match is None:
+        return _executemany(cursor, stmt, args)
+    sql = stmt[:match.start(1)] + '%s' + stmt[match.end(1):]
+    template = match.group(1)
+    # cursor.rowcount only counts the last statement, so each page is sent on its own and the counts are summed
+    args = list(args)
+    rowcount = 0
+    for start in range(0, len(args), _VALUES_PAGE_SIZE):
+        execute_values(cursor, sql, args[start:start + _VALUES_PAGE_SIZE], template=template,
+                       page_size=_VALUES_PAGE_SIZE)
+        rowcount += cursor.rowcount
+    return rowcount
+
+
+def _not_closed(connection):
+    return not connection.closed
+
+
+def _no_closed_flag(connection):
+    return True
+
+
+_psycopg_patched = False
+
+
+def _patch_psycopg():
+    """
+    Make psycopg2 wait on the gevent hub instead of blocking it. This runs once per process and needs the optional
+    psycogreen package.
+    """
+    global _psycopg_patched
+    if _psycopg_patched:
+        return
+    _psycopg_patched = True
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        _log.warning("psycogreen is not installed. Database calls through psycopg2 will block other greenlets")
+        return
+    patch_psycopg()
+    _log.debug("Patched psycopg2 for gevent")
+
+
 class ConnectionError(Exception):
     """
     Custom class for connection errors
@@ -60,20 +183,79 @@ class ConnectionError(Exception):
     pass
 
 
+def _close(obj):
+    try:
+        obj.close()
+    except BaseException as exc:
+        # if exc.__class__.__module__ == 'exceptions':
+        if exc.__class__.__module__ == 'builtins':
+            # Don't ignore built-in exceptions because they likely indicate a bug that should stop execution.
+            # psycopg2.Error subclasses Exception, so the module must also be checked.
+            raise
+        _log.exception('An exception was raised while closing the cursor and is being ignored.')
+
+
 @contextlib.contextmanager
 def closing(obj):
+    # DbDriver's own methods call _close in a try/finally to avoid creating a generator per statement
     try:
         yield obj
     finally:
+        _close(obj)
+
+
+class _PooledCursor:
+    """
+    Cursor returned by :py:meth:`DbDriver.select` when the connection was checked out from the pool only for that
+    select. The connection goes back to the pool when the cursor is closed.
+    """
+    def __init__(self, cursor, release):
+        self._cursor = cursor
+        self._release = release
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
         try:
-            obj.close()
-        except BaseException as exc:
-            # if exc.__class__.__module__ == 'exceptions':
-            if exc.__class__.__module__ == 'builtins':
-                # Don't ignore built-in exceptions because they likely indicate a bug that should stop execution.
-                # psycopg2.Error subclasses Exception, so the module must also be checked.
-                raise
-            _log.exception('An exception was raised while closing the cursor and is being ignored.')
+            self._cursor.close()
+        finally:
+            self._release()
+
+
+class _ThreadedProxy:
+    """
+    Runs every method call of a DB-API connection or cursor in the single worker thread of a gevent thread pool, so
+    the calling greenlet waits on the hub instead of blocking it. Cursors created through the proxy are proxied too.
+    """
+    __slots__ = ('_pool', '_obj')
+
+    def __init__(self, pool, obj):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_obj', obj)
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = self._pool.apply(attr, args, kwargs)
+            if result is self._obj:
+                return self
+            if name == 'cursor':
+                return _ThreadedProxy(self._pool, result)
+            return result
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._obj, name, value)
+
+    def __iter__(self):
+        return iter(self._pool.apply(self._obj.fetchall))
 
 
 class DbDriver:
@@ -82,9 +264,42 @@ class DbDriver:
     do the database operations. This class is inherited by
     - :py:class:`volttron.platform.dbutils.mysqlfuncts.MySqlFuncts`
     - :py:class:`volttron.platform.dbutils.sqlitefuncts.SqlLiteFuncts`
+
+    The results of the statement methods (``*_query`` and ``*_stmt``) are cached, so they must only depend on the
+    table names and their arguments. The cache is dropped whenever a table name attribute (``*_table``) is assigned,
+    for example when the aggregate tables are set up after the driver was created.
     """
-    def __init__(self, dbapimodule, **kwargs):
-        thread_name = threading.currentThread().getName()
+
+    def __init__(self, dbapimodule, driver_pool_size=1, driver_max_overflow=0, driver_pool_timeout=30,
+                 use_threadpool=False, max_batch_rows=1000, max_batch_seconds=None, use_greenlet_local=True,
+                 ping_interval=30, **kwargs):
+        """
+        :param dbapimodule: name of the DB-API module to connect with or a callable that returns a new connection
+        :param driver_pool_size: number of connections kept open. With the default of 1 a single connection is shared
+        by all greenlets. With more, each greenlet checks out its own connection on first use and gives it back on
+        commit or rollback, or when a read only select is done with it. The pool options are prefixed with driver_
+        so they never take a connect argument such as mysql.connector's pool_size away from the DB-API module
+        :param driver_max_overflow: number of connections that may be opened beyond driver_pool_size when all are in
+        use. These are closed instead of being returned to the pool
+        :param driver_pool_timeout: seconds to wait for a connection when the pool is exhausted before raising
+        ConnectionError
+        :param use_threadpool: only used with sqlite3, whose calls cannot yield to gevent. If True the connection is
+        created and used in a dedicated worker thread so long queries do not block other greenlets. Calls are
+        serialized through that one thread, which keeps sqlite3's same thread check satisfied
+        :param max_batch_rows: number of rows buffered by :py:meth:`bulk_insert` before they are written and
+        committed, so long bulk inserts do not hold their locks until the end
+        :param max_batch_seconds: optional limit on the age of the oldest buffered row before the rows are written
+        and committed
+        :param use_greenlet_local: keep per greenlet state (current cursor, pooled connection) in
+        a gevent local. Set to False for a driver used by a single greenlet to store that state in a plain namespace,
+        which avoids the greenlet lookup on every access. Cannot be combined with pooling
+        :param ping_interval: seconds after which cursor() checks that the connection still works before using it
+        again. Every connection keeps its own time, so a pooled connection that sat idle is checked when taken from
+        the pool. The connection is also checked on the next call after creating a cursor failed. None disables the
+        check
+        :param kwargs: keyword arguments passed to the connect function of dbapimodule
+        """
+        thread_name = threading.current_thread().name
         if callable(dbapimodule):
             _log.debug("Constructing Driver for %s in thread: %s", dbapimodule.__name__, thread_name)
             connect = dbapimodule
@@ -93,52 +308,316 @@ class DbDriver:
             _log.debug("kwargs for connect is %r", kwargs)
             dbapimodule = importlib.import_module(dbapimodule)
             connect = lambda: dbapimodule.connect(**kwargs)
+            if use_threadpool and dbapimodule.__name__ == 'sqlite3':
+                def connect():
+                    # the worker thread is started on first connect and stopped by close()
+                    if self._threadpool is None:
+                        self._threadpool = ThreadPool(1)
+                    pool = self._threadpool
+                    return _ThreadedProxy(pool, pool.apply(dbapimodule.connect, kwds=kwargs))
+        self._threadpool = None
+        self._bulk_execute = _executemany
+        if dbapimodule.__name__ == 'psycopg2':
+            _patch_psycopg()
+            self._bulk_execute = _execute_values
         self.__connect = connect
         self.__connection = None
-        self.stash = local()
+        # liveness check for the kind of connection returned by connect. Chosen when the first one is opened
+        self._is_open = None
+        self._ping_interval = ping_interval
+        # id of connection -> time of its last successful liveness check. Pooled connections are checked on their own
+        self._last_ping = {}
+        self._pool = Queue(maxsize=driver_pool_size) if driver_pool_size > 1 or driver_max_overflow else None
+        self._pool_limit = driver_pool_size + driver_max_overflow
+        self._pool_timeout = driver_pool_timeout
+        self._pool_open = 0
+        if not use_greenlet_local and self._pool is not None:
+            raise ValueError("A connection pool needs use_greenlet_local=True")
+        self.stash = local() if use_greenlet_local else types.SimpleNamespace()
+        self._sql_cache = {}
+        self._max_batch_rows = max_batch_rows
+        self._max_batch_seconds = max_batch_seconds
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name.endswith('_table'):
+            # cached statements and meta_in_topics_table are derived from the table names
+            cache = self.__dict__.get('_sql_cache')
+            if cache:
+                cache.clear()
+            self.__dict__.pop('meta_in_topics_table', None)
+
+    def _q(self, name, *args):
+        """
+        Return the sql statement built by the query method with the given name. Statements only depend on the table
+        names of the driver, so each one is built once and cached on the instance until a table name changes.
+        :param name: name of the method that returns the statement, for example 'insert_data_query'
+        :param args: optional arguments of the method. These are part of the cache key
+        :return: sql statement
+        """
+        key = (name,) + args if args else name
+        try:
+            return self._sql_cache[key]
+        except KeyError:
+            stmt = self._sql_cache[key] = getattr(self, name)(*args)
+            return stmt
 
     @contextlib.contextmanager
     def bulk_insert(self):
         """
         Function to meet bulk insert requirements. This function can be overridden by historian drivers to yield the
         required method for data insertion during bulk inserts in the respective historians. In this generic case it
-        will yield the single insert method
+        yields a method with the same signature as insert_data that buffers the rows and writes all of them with a
+        single executemany when the context exits. Whenever max_batch_rows rows (or rows older than
+        max_batch_seconds) are buffered, they are written and committed right away. Rows still buffered are not
+        written if the block raises.
         :yields: insert method
         """
-        yield self.insert_data
+        rows = []
+        append = rows.append
+        max_rows = self._max_batch_rows
+        max_seconds = self._max_batch_seconds
+        started = time.monotonic()
+
+        def flush():
+            nonlocal started
+            self.execute_many(self._q('insert_data_query'), rows, commit=True)
+            rows.clear()
+            started = time.monotonic()
+
+        if max_seconds is None:
+            def insert_data(ts, topic_id, data):
+                append((ts, topic_id, _dumps(data)))
+                if len(rows) >= max_rows:
+                    flush()
+                return True
+        else:
+            def insert_data(ts, topic_id, data):
+                append((ts, topic_id, _dumps(data)))
+                if len(rows) >= max_rows or time.monotonic() - started >= max_seconds:
+                    flush()
+                return True
+
+        yield insert_data
+        if rows:
+            self.execute_many(self._q('insert_data_query'), rows, commit=False)
 
     @contextlib.contextmanager
     def bulk_insert_meta(self):
         """
         Function to meet bulk insert requirements. This function can be overridden by historian drivers to yield the
         required method for meta insertion during bulk inserts in the respective historians. In this generic case it
-        will yield the single insert method
+        yields a method with the same signature as insert_meta that buffers the rows and writes all of them with a
+        single executemany when the context exits. Nothing is written if the block raises.
         :yields: insert method
         """
-        yield self.insert_meta
+        rows = []
+        # the same metadata object is often sent for many topics in a batch. Keep a reference next to the
+        # serialized value so the id stays valid for the lifetime of the block
+        serialized = {}
+
+        def insert_meta(topic_id, metadata):
+            try:
+                value = serialized[id(metadata)][1]
+            except KeyError:
+                value = _encode(metadata)
+                serialized[id(metadata)] = (metadata, value)
+            rows.append((topic_id, value))
+            return True
+
+        yield insert_meta
+        if rows:
+            self.execute_many(self._q('insert_meta_query'), rows, commit=False)
+
+    def insert_data_many(self, rows):
+        """
+        Insert data rows for any number of topics. The rows are written with executemany in chunks of max_batch_rows.
+        Like :py:meth:`bulk_insert` every full chunk is committed, and so is every chunk written max_batch_seconds or
+        later after the last commit. The age is checked between chunks, so a chunk is never split. Drivers that
+        override bulk_insert get their own bulk insert.
+        :param rows: list of (ts, topic_id, data) tuples
+        :return: number of rows inserted. Raises exception if unable to connect to database
+        """
+        if type(self).bulk_insert is not DbDriver.bulk_insert:
+            with self.bulk_insert() as insert_data:
+                for ts, topic_id, data in rows:
+                    insert_data(ts, topic_id, data)
+            return len(rows)
+        args = [(ts, topic_id, _dumps(data)) for ts, topic_id, data in rows]
+        stmt = self._q('insert_data_query')
+        step = self._max_batch_rows
+        max_seconds = self._max_batch_seconds
+        started = time.monotonic()
+        for start in range(0, len(args), step):
+            chunk = args[start:start + step]
+            commit = len(chunk) == step or (max_seconds is not None and time.monotonic() - started >= max_seconds)
+            self.execute_many(stmt, chunk, commit=commit)
+            if commit:
+                started = time.monotonic()
+        return len(args)
+
+    def insert_meta_many(self, rows):
+        """
+        Insert metadata for any number of topics with one executemany. Drivers that override
+        :py:meth:`bulk_insert_meta` get their own bulk insert.
+        :param rows: list of (topic_id, metadata, metadata_json) tuples. metadata_json is the metadata as returned
+        by :py:meth:`serialize_metadata`, or None to have it serialized here
+        :return: number of rows inserted. Raises exception if unable to connect to database
+        """
+        if type(self).bulk_insert_meta is not DbDriver.bulk_insert_meta:
+            with self.bulk_insert_meta() as insert_meta:
+                for topic_id, metadata, _ in rows:
+                    insert_meta(topic_id, metadata)
+            return len(rows)
+        if rows:
+            args = [(topic_id, _encode(metadata) if metadata_json is None else metadata_json)
+                    for topic_id, metadata, metadata_json in rows]
+            self.execute_many(self._q('insert_meta_query'), args, commit=False)
+        return len(rows)
+
+    def serialize_metadata(self, metadata):
+        """
+        Serialize metadata the way it is written to the database. The historian compares these strings to detect
+        changed metadata and passes them to :py:meth:`insert_meta_many` so the metadata is not serialized twice
+        :param metadata: metadata
+        :return: json string
+        """
+        return _encode(metadata)
 
     def cursor(self):
 
         self.stash.cursor = None
-        if self.__connection is not None and not getattr(self.__connection, "closed", False):
+        connection = self._connection()
+        if connection is not None and self._is_open(connection) and self._ping(connection):
             try:
-                self.stash.cursor = self.__connection.cursor()
-                return self.stash.cursor
+                self.stash.cursor = connection.cursor()
             except Exception:
-                _log.warning("An exception occurred while creating a cursor. Will try establishing connection again")
-        self.__connection = None
+                # check the connection before it is used again
+                self._last_ping.pop(id(connection), None)
+                raise
+            return self.stash.cursor
+        self._release_reusable_cursor()
+        if self._pool is None:
+            if connection is not None:
+                self._last_ping.pop(id(connection), None)
+            self.__connection = None
+            connection = self.__connection = self._open_connection()
+        else:
+            if connection is not None:
+                self._discard_connection(connection)
+            connection = self.stash.connection = self._checkout_connection()
+
+        # if any exception happens here have it go to the caller.
+        self.stash.cursor = connection.cursor()
+
+        return self.stash.cursor
+
+    def _ping(self, connection):
+        """
+        Check that the connection still works, at most once every ping_interval seconds. Uses the ping() method of
+        the connection when the DB-API module has one (MySQL), else runs `SELECT 1`.
+        :return: False if the connection should be replaced
+        """
+        if self._ping_interval is None:
+            return True
+        now = time.monotonic()
+        last_ping = self._last_ping.get(id(connection))
+        if last_ping is not None and now - last_ping < self._ping_interval:
+            return True
         try:
-            self.__connection = self.__connect()
+            ping = getattr(connection, 'ping', None)
+            if ping is not None:
+                ping()
+            else:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                finally:
+                    _close(cursor)
+        except Exception:
+            _log.warning("Database connection failed the liveness check. Will try establishing connection again")
+            return False
+        self._last_ping[id(connection)] = now
+        return True
+
+    def _connection(self):
+        """
+        :return: connection used by the current greenlet or None if there is none yet
+        """
+        if self._pool is None:
+            return self.__connection
+        return getattr(self.stash, 'connection', None)
+
+    def _open_connection(self):
+        try:
+            connection = self.__connect()
         except Exception as e:
             _log.error("Could not connect to database. Raise ConnectionError")
             raise ConnectionError(e).with_traceback(sys.exc_info()[2])
-        if self.__connection is None:
+        if connection is None:
             raise ConnectionError("Unknown error. Could not connect to database")
+        if self._is_open is None:
+            # sqlite3 connections have no closed flag, psycopg2 connections do
+            self._is_open = _not_closed if hasattr(connection, 'closed') else _no_closed_flag
+        self._last_ping[id(connection)] = time.monotonic()
+        return connection
 
-        # if any exception happens here have it go to the caller.
-        self.stash.cursor = self.__connection.cursor()
+    def _checkout_connection(self):
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except Empty:
+                if self._pool_open < self._pool_limit:
+                    self._pool_open += 1
+                    try:
+                        return self._open_connection()
+                    except Exception:
+                        self._pool_open -= 1
+                        raise
+                try:
+                    connection = self._pool.get(timeout=self._pool_timeout)
+                except Empty:
+                    raise ConnectionError("Timed out after {} seconds waiting for a database connection from the "
+                                          "pool".format(self._pool_timeout))
+            # the connection may have been idle in the pool for longer than ping_interval
+            if self._is_open(connection) and self._ping(connection):
+                return connection
+            self._discard_connection(connection)
 
-        return self.stash.cursor
+    def _release_connection(self):
+        """
+        Give the connection of the current greenlet back to the pool. Does nothing if pooling is disabled.
+        """
+        connection = getattr(self.stash, 'connection', None)
+        if connection is None:
+            return
+        self.stash.connection = None
+        try:
+            self._pool.put_nowait(connection)
+        except Full:
+            self._discard_connection(connection)
+
+    def _discard_connection(self, connection):
+        self._pool_open -= 1
+        self._last_ping.pop(id(connection), None)
+        _close(connection)
+
+    def _get_reusable_cursor(self):
+        """
+        Return the cursor shared by the single row statements of the current transaction in this greenlet, creating
+        it if needed. The cursor is closed on commit, rollback or when the connection is re-established.
+        """
+        cursor = getattr(self.stash, 'reusable_cursor', None)
+        if cursor is None:
+            cursor = self.stash.reusable_cursor = self.cursor()
+        return cursor
+
+    def _release_reusable_cursor(self):
+        cursor = getattr(self.stash, 'reusable_cursor', None)
+        if cursor is not None:
+            self.stash.reusable_cursor = None
+            _close(cursor)
 
     @abstractmethod
     def setup_historian_tables(self):
@@ -157,6 +636,14 @@ class DbDriver:
         """
         pass
 
+    @functools.cached_property
+    def meta_in_topics_table(self):
+        """
+        True if metadata is stored in a column of the topics table instead of a separate metadata table. Computed
+        once and recomputed after a table name is assigned.
+        """
+        return self.meta_table == self.topics_table
+
     @abstractmethod
     def get_agg_topics(self):
         """
@@ -286,7 +773,7 @@ class DbDriver:
         :param metadata: metadata
         :return: True if execution completes. Raises exception if unable to connect to database
         """
-        self.execute_stmt(self.insert_meta_query(), (topic_id, jsonapi.dumps(metadata)), commit=False)
+        self.execute_stmt_fast(self._q('insert_meta_query'), (topic_id, _dumps(metadata)))
         return True
 
     def update_meta(self, topic_id, metadata):
@@ -296,7 +783,7 @@ class DbDriver:
         :param metadata: metadata
         :return: True if execution completes. Raises exception if unable to connect to database
         """
-        self.execute_stmt(self.update_meta_query(), (jsonapi.dumps(metadata), topic_id), commit=False)
+        self.execute_stmt_fast(self._q('update_meta_query'), (_dumps(metadata), topic_id))
         return True
 
     def insert_data(self, ts, topic_id, data):
@@ -307,7 +794,7 @@ class DbDriver:
         :param data: data value
         :return: True if execution completes. raises Exception if unable to connect to database
         """
-        self.execute_stmt(self.insert_data_query(), (ts, topic_id, jsonapi.dumps(data)), commit=False)
+        self.execute_stmt_fast(self._q('insert_data_query'), (ts, topic_id, _dumps(data)))
         return True
 
     def insert_topic(self, topic, **kwargs):
@@ -318,17 +805,28 @@ class DbDriver:
         """
         meta = kwargs.get('metadata')
         insert_topic_only = True
-        if self.meta_table == self.topics_table and topic and meta:
-            value = (topic, jsonapi.dumps(kwargs.get("metadata")))
-            query = self.insert_topic_and_meta_query()
+        if self.meta_in_topics_table and topic and meta:
+            value = (topic, _dumps(kwargs.get("metadata")))
+            query = self._q('insert_topic_and_meta_query')
         else:
             value = (topic,)
-            query = self.insert_topic_query()
+            query = self._q('insert_topic_query')
 
-        with closing(self.cursor()) as cursor:
-            _log.debug(f"Inserting topic {query} {value}")
-            cursor.execute(query, value)
-            return cursor.lastrowid
+        _log.debug("Inserting topic %s %s", query, value)
+        cursor = self._get_reusable_cursor()
+        cursor.execute(query, value)
+        topic_id = cursor.lastrowid
+        return topic_id
+
+    def insert_topics_bulk(self, topics_with_meta):
+        """
+        Insert several new topics. Drivers whose database can return the ids of a multi row insert (for example
+        `INSERT ... RETURNING topic_id` on Postgres) should override this to insert all of them in one statement.
+        This generic version calls :py:meth:`insert_topic` for each topic.
+        :param topics_with_meta: iterable of (topic, metadata) tuples. metadata may be None
+        :return: dict of format {topic: topic_id}. Raises exception if unable to connect to database
+        """
+        return {topic: self.insert_topic(topic, metadata=meta) for topic, meta in topics_with_meta}
 
     def update_topic(self, topic, topic_id, **kwargs):
         """
@@ -338,12 +836,11 @@ class DbDriver:
         :return: True if execution is complete. Raises exception if unable to connect to database
         """
         meta = kwargs.get('metadata')
-        if self.meta_table == self.topics_table and topic and meta:
-                self.execute_stmt(self.update_topic_and_meta_query(), (topic, jsonapi.dumps(meta), topic_id),
-                                  commit=False)
+        if self.meta_in_topics_table and topic and meta:
+                self.execute_stmt_fast(self._q('update_topic_and_meta_query'), (topic, _dumps(meta), topic_id))
         else:
             # either topic and meta table are separate or no meta was sent
-            self.execute_stmt(self.update_topic_query(), (topic, topic_id), commit=False)
+            self.execute_stmt_fast(self._q('update_topic_query'), (topic, topic_id))
         return True
 
     def insert_agg_meta(self, topic_id, metadata):
@@ -353,7 +850,7 @@ class DbDriver:
         :param metadata: metadata
         :return: True if execution completes. Raises exception if connection to database fails
         """
-        self.execute_stmt(self.replace_agg_meta_stmt(), (topic_id, jsonapi.dumps(metadata)), commit=False)
+        self.execute_stmt(self._q('replace_agg_meta_stmt'), (topic_id, _dumps(metadata)), commit=False)
         return True
 
     def insert_agg_topic(self, topic, agg_type, agg_time_period):
@@ -364,9 +861,12 @@ class DbDriver:
         :param agg_time_period: time period of aggregation
         :return: id of the topic inserted if insert was successful. Raises exception if unable to connect to database
         """
-        with closing(self.cursor()) as cursor:
-            cursor.execute(self.insert_agg_topic_stmt(), (topic, agg_type, agg_time_period))
+        cursor = self.cursor()
+        try:
+            cursor.execute(self._q('insert_agg_topic_stmt'), (topic, agg_type, agg_time_period))
             return cursor.lastrowid
+        finally:
+            _close(cursor)
 
     def update_agg_topic(self, agg_id, agg_topic_name):
         """
@@ -376,7 +876,7 @@ class DbDriver:
         :return: True if execution is complete. Raises exception if unable to
         connect to database
         """
-        self.execute_stmt(self.update_agg_topic_stmt(), (agg_topic_name, agg_id),commit=False)
+        self.execute_stmt(self._q('update_agg_topic_stmt'), (agg_topic_name, agg_id), commit=False)
         return True
 
     def commit(self):
@@ -385,9 +885,12 @@ class DbDriver:
 
         :return: True if successful, False otherwise
         """
-        if self.__connection is not None:
+        self._release_reusable_cursor()
+        connection = self._connection()
+        if connection is not None:
             try:
-                self.__connection.commit()
+                connection.commit()
+                self._release_connection()
                 return True
             except sqlite3.OperationalError as e:
                 if "database is locked" in str(e):
@@ -397,6 +900,9 @@ class DbDriver:
                                "configure a higher timeout in agent configuration under \nconfig[\"connection\"]"
                                "[\"params\"][\"timeout\"] Default value is 10. Timeout units is seconds")
                 raise
+        if self._pool is not None:
+            # this greenlet holds no pooled connection, so there is nothing to commit
+            return True
         _log.warning('connection was null during commit phase.')
         return False
 
@@ -405,8 +911,15 @@ class DbDriver:
         Rollback a transaction
         :return: True if successful, False otherwise
         """
-        if self.__connection is not None:
-            self.__connection.rollback()
+        self._release_reusable_cursor()
+        connection = self._connection()
+        if connection is not None:
+            try:
+                connection.rollback()
+            finally:
+                self._release_connection()
+            return True
+        if self._pool is not None:
             return True
         _log.warning('connection was null during rollback phase.')
         return False
@@ -416,8 +929,26 @@ class DbDriver:
         Close connection to database
         :return:
         """
-        if self.__connection is not None:
-            self.__connection.close()
+        try:
+            self._release_reusable_cursor()
+            if self._pool is not None:
+                self._release_connection()
+                while True:
+                    try:
+                        connection = self._pool.get_nowait()
+                    except Empty:
+                        break
+                    self._discard_connection(connection)
+            elif self.__connection is not None:
+                self._last_ping.pop(id(self.__connection), None)
+                self.__connection.close()
+        finally:
+            if self._threadpool is not None:
+                # stop the sqlite worker thread. Connections made through it cannot be used anymore, a later
+                # connect starts a new one
+                self._threadpool.kill()
+                self._threadpool = None
+                self.__connection = None
 
     def select(self, query, args=None, fetch_all=True):
         """
@@ -431,17 +962,49 @@ class DbDriver:
         """
         if not args:
             args = ()
+        # a pooled connection checked out only for this select has no pending writes and can go back to the pool
+        # as soon as the select is done with it
+        release = self._pool is not None and self._connection() is None
         cursor = self.cursor()
         try:
             cursor.execute(query, args)
         except Exception:
             cursor.close()
+            if release:
+                self._release_connection()
             raise
         if fetch_all:
-            with closing(cursor):
+            try:
                 return cursor.fetchall()
+            finally:
+                _close(cursor)
+                if release:
+                    self._release_connection()
+        if release:
+            return _PooledCursor(cursor, self._release_connection)
         return cursor
 
+    def select_columnar(self, query, args=None, batch_size=10000):
+        """
+        Execute a select statement and return the result column by column instead of as a list of row tuples.
+        Rows are read from the cursor in batches of batch_size, so the whole result is never held as rows.
+        :param query: select statement
+        :param args: arguments for the where clause
+        :param batch_size: number of rows fetched from the cursor at a time
+        :return: list with one list of values per column of the result, for example [timestamps, values]
+        """
+        cursor = self.select(query, args, fetch_all=False)
+        try:
+            columns = [[] for _ in cursor.description or ()]
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            _close(cursor)
+        return columns
+
     def execute_stmt(self, stmt, args=None, commit=False):
         """
         Execute a sql statement
@@ -452,11 +1015,26 @@ class DbDriver:
         """
         if args is None:
             args = ()
-        with closing(self.cursor()) as cursor:
+        cursor = self.cursor()
+        try:
             cursor.execute(stmt, args)
             if commit:
                 self.commit()
             return cursor.rowcount
+        finally:
+            _close(cursor)
+
+    def execute_stmt_fast(self, stmt, args):
+        """
+        Execute a sql statement on the cursor reused across the current transaction. Unlike execute_stmt no cursor
+        is created or closed per call and the statement is never committed.
+        :param stmt: the statement to execute
+        :param args: arguments of the statement
+        :return: count of the number of affected rows
+        """
+        cursor = self._get_reusable_cursor()
+        cursor.execute(stmt, args)
+        return cursor.rowcount
 
     def execute_many(self, stmt, args, commit=False):
         """
@@ -466,11 +1044,14 @@ class DbDriver:
         :param commit: True if transaction should be committed. Defaults to False
         :return: count of the number of affected rows
         """
-        with closing(self.cursor()) as cursor:
-            cursor.executemany(stmt, args)
+        cursor = self.cursor()
+        try:
+            rowcount = self._bulk_execute(cursor, stmt, args)
             if commit:
                 self.commit()
-            return cursor.rowcount
+            return rowcount
+        finally:
+            _close(cursor)
 
     @abstractmethod
     def query(self, topic_ids, id_name_map, start=None, end=None, agg_type=None, agg_period=None, skip=0, count=None,
@@ -540,12 +1121,28 @@ class DbDriver:
         :return: True if execution was successful, raises exception in case of connection failures
         """
         table_name = agg_type + '_' + period
-        _log.debug("Inserting aggregate: {} {} {} {} into table {}".format(
-            ts, agg_topic_id, data, str(topic_ids), table_name))
-        self.execute_stmt(self.insert_aggregate_stmt(table_name),
+        _log.debug("Inserting aggregate: %s %s %s %s into table %s", ts, agg_topic_id, data, topic_ids, table_name)
+        self.execute_stmt(self._q('insert_aggregate_stmt', table_name),
                           (ts, agg_topic_id, data, str(topic_ids)), commit=True)
         return True
 
+    def insert_aggregates(self, agg_type, period, rows):
+        """
+        Insert aggregate data collected for several aggregate topics for the same time period in one executemany.
+        Data is inserted into <agg_type>_<period> table
+        :param agg_type: type of aggregation
+        :param period: time period of aggregation
+        :param rows: iterable of (ts, agg_topic_id, data, topic_ids) tuples with the same meaning as the arguments of
+        :py:meth:`insert_aggregate`
+        :return: True if execution was successful, raises exception in case of connection failures
+        """
+        table_name = agg_type + '_' + period
+        args = [(ts, agg_topic_id, data, str(topic_ids)) for ts, agg_topic_id, data, topic_ids in rows]
+        _log.debug("Inserting %s aggregates into table %s", len(args), table_name)
+        if args:
+            self.execute_many(self._q('insert_aggregate_stmt', table_name), args, commit=True)
+        return True
+
     @abstractmethod
     def collect_aggregate(self, topic_ids, agg_type, start=None, end=None):
         """
@@ -557,3 +1154,18 @@ class DbDriver:
         :return: a tuple of (aggregated value, count of records over which this aggregation was computed)
         """
         pass
+
+    def collect_aggregates(self, groups, agg_type, start=None, end=None):
+        """
+        Collect the aggregate data for several groups of topics over the same time range. Drivers should override this
+        to compute all groups with a single grouped query (for example `SELECT topic_id, AVG(...) ... WHERE topic_id
+        IN (...) GROUP BY topic_id` when every group is a single topic). This generic version calls
+        :py:meth:`collect_aggregate` once per group.
+        :param groups: iterable of lists of topic ids. Each list is aggregated into one value
+        :param agg_type: type of aggregation
+        :param start: start time for query (inclusive)
+        :param end:  end time for query (exclusive)
+        :return: dict of format {tuple(topic_ids): (aggregated value, count of records)}
+        """
+        return {tuple(topic_ids): self.collect_aggregate(topic_ids, agg_type, start=start, end=end)
+                for topic_ids in groups}
@@ -40,6 +40,8 @@
 import logging
 import sys
 import threading
+from itertools import repeat
+from operator import itemgetter
 
 from volttron import utils
 from volttron.historian.base import BaseHistorian
@@ -51,12 +53,47 @@ __version__ = "4.0.0"
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
+# upper bound on the number of memoized lower case topic names
+_LOWERCASE_CACHE_SIZE = 100000
+
+_point_fields = itemgetter('topic', 'meta', 'timestamp', 'value')
+
+# applied to every sqlite connection the historian creates. They only last for the connection
+_SQLITE_CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+# applied to the background connection unless the historian is readonly. journal_mode=WAL is stored in the database
+# file. WAL lets the query connection read while the background connection writes and turns each commit into an
+# append to the log, NORMAL sync is safe with WAL
+_SQLITE_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+)
+
 
 class MaskedString(str):
+    __slots__ = ()
+
     def __repr__(self):
         return repr('********')
 
 
+class TopicRecord:
+    """
+    Cached state of one topic: its id, the topic name as stored in the database, its metadata (None when no
+    metadata has been stored for the topic) and that metadata serialized the way the driver stores it. A topic
+    without metadata carries the serialized empty dict.
+    """
+    __slots__ = ('id', 'name', 'meta', 'meta_json')
+
+    def __init__(self, topic_id, name, meta=None, meta_json='{}'):
+        self.id = topic_id
+        self.name = name
+        self.meta = meta
+        self.meta_json = meta_json
+
+
 def historian(config_path, **kwargs):
     """
     This method is called by the :py:func:`sqlhistorian.historian.main` to
@@ -108,8 +145,9 @@ class SQLHistorian(BaseHistorian):
 
         The historian makes two connections to the data store.  Both of
         these connections are available across the main and processing
-        thread of the historian.  topic_map and topic_meta are used as
-        cache for the meta data and topic maps.
+        thread of the historian.  topics maps lower case topic names to
+        a TopicRecord and is used as cache for the topic ids, names and meta
+        data.
 
         :param connection: dictionary that contains necessary information to
         establish a connection to the sql database. The dictionary should
@@ -134,9 +172,12 @@ class SQLHistorian(BaseHistorian):
         """
         self.connection = connection
         self.tables_def, self.table_names = self.parse_table_def(tables_def)
-        self.topic_id_map = {}
-        self.topic_name_map = {}
-        self.topic_meta = {}
+        self.topics = {}
+        # topic name -> lower case topic name. Topics repeat, so lower() is done once per distinct name
+        self._lowercase_names = {}
+        # names returned by query_topic_list. Only the background thread, which adds and renames topics, replaces
+        # it. It is a tuple so it can be handed to callers as it is
+        self._topic_names = ()
         self.agg_topic_id_map = {}
         # Create two instance so connection is shared within a single thread.
         # This is because sqlite only supports sharing of connection within
@@ -165,66 +206,117 @@ class SQLHistorian(BaseHistorian):
     def publish_to_historian(self, to_publish_list):
         try:
             published = 0
-            with self.bg_thread_dbutils.bulk_insert() as insert_data, \
-                self.bg_thread_dbutils.bulk_insert_meta() as insert_meta:
-
-                for x in to_publish_list:
-                    ts = x['timestamp']
-                    topic = x['topic']
-                    value = x['value']
-                    meta = x['meta']
-
-                    # look at the topics that are stored in the database already to see if this topic has a value
-                    lowercase_name = topic.lower()
-                    topic_id = self.topic_id_map.get(lowercase_name, None)
-                    db_topic_name = self.topic_name_map.get(lowercase_name,
-                                                            None)
-                    old_meta = self.topic_meta.get(topic_id, {})
-                    update_topic_meta = True
-                    if topic_id is None:
-                        # send metadata data too. If topics table contains metadata column too it will get inserted
-                        topic_id = self.bg_thread_dbutils.insert_topic(topic, metadata=meta)
-                        # user lower case topic name when storing in map for case insensitive comparison
-                        self.topic_name_map[lowercase_name] = topic
-                        self.topic_id_map[lowercase_name] = topic_id
-                        update_topic_meta = False
-                    elif db_topic_name != topic:
-                        if old_meta != meta:
-                            _log.debug(f"META HAS CHANGED TOO. old:{old_meta} new:{meta}")
-                            # pass metadata if metadata is stored in topics table metadata will get updated too
-                            # if not will get ignored
-                            self.bg_thread_dbutils.update_topic(topic, topic_id, metadata=meta)
-                            update_topic_meta = False
-                        else:
-                            self.bg_thread_dbutils.update_topic(topic, topic_id)
-                        self.topic_name_map[lowercase_name] = topic
-
-                    if old_meta != meta:
-                        if self.bg_thread_dbutils.topics_table != self.bg_thread_dbutils.meta_table:
-                            # there is a separate metadata table. do bulk insert
-                            _log.debug("meta in separate table")
-                            insert_meta(topic_id, meta)
-                        elif update_topic_meta:
-                            _log.debug(" meta in same table. no topic change only meta changed")
-                            # topic name and metadata are in same table, and metadata has not got into db during insert
-                            # or update of topic so update meta alone in topics table
-                            self.bg_thread_dbutils.update_meta(metadata=meta, topic_id=topic_id)
-
-                        # either way update cache
-                        self.topic_meta[topic_id] = meta
-
-                    if insert_data(ts, topic_id, value):
-                        published += 1
+            # Group the points by topic so that topic and metadata are resolved once per topic instead of once per
+            # point. Case variants of a topic share a group, the name and metadata of the last point win, which is
+            # what processing the points one by one would leave in the database.
+            lowercase_names = self._lowercase_names
+            batch = {}
+            get_group = batch.get
+            # each group is [topic, meta, timestamps, values]
+            for topic, meta, ts, value in map(_point_fields, to_publish_list):
+                try:
+                    lowercase_name = lowercase_names[topic]
+                except KeyError:
+                    lowercase_name = self._lower(topic)
+                group = get_group(lowercase_name)
+                if group is None:
+                    batch[lowercase_name] = [topic, meta, [ts], [value]]
+                else:
+                    group[0] = topic
+                    group[1] = meta
+                    group[2].append(ts)
+                    group[3].append(value)
+
+            # Phase 1 resolves every topic against the cache without touching the database. It sorts the topics into
+            # new topics, renamed topics and topics whose metadata changed, and collects the data rows of known topics.
+            rows = []
+            meta_rows = []
+            new_topics = []
+            renamed = []
+            # (rec, meta, meta_json, in_topic_row) in_topic_row is True when the metadata goes into the topics
+            # table together with the topic name
+            changed_meta = []
+            topics = self.topics
+            dbutils = self.bg_thread_dbutils
+            meta_in_topics_table = dbutils.meta_in_topics_table
+            serialize_metadata = dbutils.serialize_metadata
+            for lowercase_name, (topic, meta, timestamps, values) in batch.items():
+                # look at the topics that are stored in the database already to see if this topic has a value
+                rec = topics.get(lowercase_name)
+                meta_json = serialize_metadata(meta)
+                if rec is None:
+                    new_topics.append((lowercase_name, topic, meta, meta_json, timestamps, values))
+                    continue
+                meta_changed = meta_json != rec.meta_json
+                if rec.name != topic:
+                    renamed.append((rec, topic, meta, meta_changed))
+                if meta_changed:
+                    changed_meta.append((rec, meta, meta_json, rec.name != topic))
+                rows.extend(zip(timestamps, repeat(rec.id), values))
+
+            # Phase 2 writes to the database
+            # In steady state every topic is known with unchanged name and metadata and only the data rows are
+            # written, so the topic and metadata writes are skipped as a whole
+            if new_topics or renamed or changed_meta:
+                if new_topics:
+                    # send metadata data too. If topics table contains metadata column too it will get inserted.
+                    # Drivers can insert all new topics of the batch with one statement
+                    new_topic_ids = dbutils.insert_topics_bulk(
+                        [(topic, meta) for _, topic, meta, _, _, _ in new_topics])
+                for lowercase_name, topic, meta, meta_json, timestamps, values in new_topics:
+                    topic_id = new_topic_ids[topic]
+                    # user lower case topic name when storing in map for case insensitive comparison
+                    rec = topics[lowercase_name] = TopicRecord(topic_id, sys.intern(topic))
+                    if meta_json != rec.meta_json:
+                        changed_meta.append((rec, meta, meta_json, True))
+                    rows.extend(zip(timestamps, repeat(topic_id), values))
+
+                for rec, topic, meta, meta_changed in renamed:
+                    if meta_changed:
+                        _log.debug("META HAS CHANGED TOO. old:%s new:%s", rec.meta or {}, meta)
+                        # pass metadata if metadata is stored in topics table metadata will get updated too
+                        # if not will get ignored
+                        dbutils.update_topic(topic, rec.id, metadata=meta)
+                    else:
+                        dbutils.update_topic(topic, rec.id)
+                    rec.name = sys.intern(topic)
+
+                if renamed:
+                    self._topic_names = tuple(rec.name for rec in topics.values())
+                elif new_topics:
+                    # new topics are appended to the topics dict, so they go to the end of the names as well
+                    self._topic_names += tuple(topics[new[0]].name for new in new_topics)
+
+                for rec, meta, meta_json, in_topic_row in changed_meta:
+                    if not meta_in_topics_table:
+                        # there is a separate metadata table. do bulk insert
+                        _log.debug("meta in separate table")
+                        meta_rows.append((rec.id, meta, meta_json))
+                    elif not in_topic_row:
+                        _log.debug(" meta in same table. no topic change only meta changed")
+                        # topic name and metadata are in same table, and metadata has not got into db during insert
+                        # or update of topic so update meta alone in topics table
+                        dbutils.update_meta(metadata=meta, topic_id=rec.id)
+
+                    # either way update cache
+                    rec.meta = meta
+                    rec.meta_json = meta_json
+
+                dbutils.insert_meta_many(meta_rows)
+
+            # data rows are written with one executemany
+            published = dbutils.insert_data_many(rows)
 
             if published:
                 if self.bg_thread_dbutils.commit():
                     _log.debug("Reporting all handled")
                     self.report_all_handled()
                 else:
-                    _log.warning('Commit error. Rolling back {} values.'.format(published))
+                    # chunks of a large batch may have been committed already, only the rest is rolled back
+                    _log.warning('Commit error. Rolling back the uncommitted part of %s values written.', published)
                     self.bg_thread_dbutils.rollback()
             else:
-                _log.warning('Unable to publish {}'.format(len(to_publish_list)))
+                _log.warning('Unable to publish %s', len(to_publish_list))
         except Exception as e:
             # TODO Unable to send alert from here
             # if isinstance(e, ConnectionError):
@@ -244,12 +336,10 @@ class SQLHistorian(BaseHistorian):
     #@doc_inherit
     def query_topic_list(self):
 
-        _log.debug("query_topic_list Thread is: {}".format(threading.currentThread().getName()))
-        if len(self.topic_name_map) > 0:
-            return list(self.topic_name_map.values())
-        else:
-            # No topics present.
-            return []
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("query_topic_list Thread is: %s", threading.current_thread().name)
+        # the tuple is never changed, only replaced, so it is returned without a copy. Empty when no topics are present
+        return self._topic_names
 
     #@doc_inherit
     def query_topics_by_pattern(self, topic_pattern):
@@ -259,14 +349,16 @@ class SQLHistorian(BaseHistorian):
     def query_topics_metadata(self, topics):
         meta = {}
         if isinstance(topics, str):
-            topic_id = self.topic_id_map.get(topics.lower())
-            if topic_id:
-                meta = {topics: self.topic_meta.get(topic_id)}
+            rec = self.topics.get(self._lower(topics))
+            if rec is not None and rec.id:
+                meta = {topics: rec.meta}
         elif isinstance(topics, list):
+            get_rec = self.topics.get
+            lower = self._lower
             for topic in topics:
-                topic_id = self.topic_id_map.get(topic.lower())
-                if topic_id:
-                    meta[topic] = self.topic_meta.get(topic_id)
+                rec = get_rec(lower(topic))
+                if rec is not None and rec.id:
+                    meta[topic] = rec.meta
         return meta
 
     def query_aggregate_topics(self):
@@ -275,7 +367,8 @@ class SQLHistorian(BaseHistorian):
     #@doc_inherit
     def query_historian(self, topic, start=None, end=None, agg_type=None, agg_period=None, skip=0, count=None,
                         order="FIRST_TO_LAST"):
-        _log.debug("query_historian Thread is: {}".format(threading.currentThread().getName()))
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("query_historian Thread is: %s", threading.current_thread().name)
         results = dict()
         topics_list = []
         if isinstance(topic, str):
@@ -285,35 +378,39 @@ class SQLHistorian(BaseHistorian):
 
         multi_topic_query = len(topics_list) > 1
 
+        lowercase_names = [self._lower(topic) for topic in topics_list]
+        if agg_type:
+            agg_type = agg_type.lower()
+            agg_topic_id_map = self.agg_topic_id_map
+            keys = [(topic_lower, agg_type, agg_period) for topic_lower in lowercase_names]
+            ids = [agg_topic_id_map.get(key) for key in keys]
+            if None in ids:
+                # load agg topic ids again as some might be newly configured aggregations. Once per query is enough,
+                # a topic still missing after that has no such aggregation
+                agg_topic_id_map.update(self.main_thread_dbutils.get_agg_topic_map())
+                _log.debug(" Agg topic map after updating %s ", agg_topic_id_map)
+                ids = [agg_topic_id_map.get(key) for key in keys]
+        else:
+            ids = [rec.id if rec is not None else None for rec in map(self.topics.get, lowercase_names)]
+
         topic_ids = []
         id_name_map = {}
-        for topic in topics_list:
-            topic_lower = topic.lower()
-            topic_id = self.topic_id_map.get(topic_lower)
-            if agg_type:
-                agg_type = agg_type.lower()
-                topic_id = self.agg_topic_id_map.get((topic_lower, agg_type, agg_period))
-                if topic_id is None:
-                    # load agg topic id again as it might be a newly configured aggregation
-                    agg_map = self.main_thread_dbutils.get_agg_topic_map()
-                    self.agg_topic_id_map.update(agg_map)
-                    _log.debug(" Agg topic map after updating {} ".format(self.agg_topic_id_map))
-                    topic_id = self.agg_topic_id_map.get((topic_lower, agg_type, agg_period))
+        for topic_id, topic in zip(ids, topics_list):
             if topic_id:
                 topic_ids.append(topic_id)
                 id_name_map[topic_id] = topic
             else:
-                _log.warning('No such topic {}'.format(topic))
+                _log.warning('No such topic %s', topic)
 
         if not topic_ids:
-            _log.warning('No topic ids found for topics{}. Returning empty result'.format(topics_list))
+            _log.warning('No topic ids found for topics%s. Returning empty result', topics_list)
             return results
 
-        _log.debug("Querying db reader with topic_ids {} ".format(topic_ids))
+        _log.debug("Querying db reader with topic_ids %s ", topic_ids)
 
         values = self.main_thread_dbutils.query(topic_ids, id_name_map, start=start, end=end, agg_type=agg_type,
                                                 agg_period=agg_period, skip=skip, count=count, order=order)
-        meta_tid = None
+        meta_rec = None
         if len(values) > 0:
             # If there are results add metadata if it is a query on a single topic
             if not multi_topic_query:
@@ -321,16 +418,16 @@ class SQLHistorian(BaseHistorian):
                 if agg_type:
                     # if aggregation is on single topic find the topic id in the topics table that corresponds to
                     # agg_topic_id so that we can grab the correct metadata if topic name does not have entry in
-                    # topic_id_map it is a user configured aggregation_topic_name which denotes aggregation across
+                    # the topics map it is a user configured aggregation_topic_name which denotes aggregation across
                     # multiple points
                     _log.debug("Single topic aggregate query. Try to get metadata")
-                    meta_tid = self.topic_id_map.get(topic.lower(), None)
-                else:
-                    # this is a query on raw data, get metadata for topic from topic_meta map
-                    meta_tid = topic_ids[0]
+                # either way the metadata is that of the topic record of the queried topic, if there is one
+                meta_rec = self.topics.get(lowercase_names[0])
 
             if values:
-                metadata = self.topic_meta.get(meta_tid, {})
+                metadata = {}
+                if meta_rec is not None and meta_rec.meta is not None:
+                    metadata = meta_rec.meta
                 results = {'values': values, 'metadata': metadata}
             else:
                 results = dict()
@@ -338,25 +435,65 @@ class SQLHistorian(BaseHistorian):
 
     #@doc_inherit
     def historian_setup(self):
-        thread_name = threading.currentThread().getName()
-        _log.info("historian_setup on Thread: {}".format(thread_name))
+        _log.info("historian_setup on Thread: %s", threading.current_thread().name)
         self.bg_thread_dbutils = self.get_dbfuncts_object()
 
         if not self._readonly:
+            self._set_sqlite_pragmas(self.bg_thread_dbutils, _SQLITE_WRITER_PRAGMAS)
             self.bg_thread_dbutils.setup_historian_tables()
 
         topic_id_map, topic_name_map = self.bg_thread_dbutils.get_topic_map()
-        self.topic_id_map.update(topic_id_map)
-        self.topic_name_map.update(topic_name_map)
         self.agg_topic_id_map = self.bg_thread_dbutils.get_agg_topic_map()
         topic_meta_map = self.bg_thread_dbutils.get_topic_meta_map()
-        self.topic_meta.update(topic_meta_map)
-        _log.debug(f"###DEBUG Loaded topics and metadata on start. Len of  topics {len(self.topic_id_map)} "
-                   f"Len of metadata: {len(self.topic_meta)}")
+        loaded = {}
+        for lowercase_name, topic_id in topic_id_map.items():
+            name = topic_name_map.get(lowercase_name)
+            if name is not None:
+                name = sys.intern(name)
+            meta = topic_meta_map.get(topic_id)
+            rec = TopicRecord(topic_id, name, meta)
+            if meta is not None:
+                rec.meta_json = self.bg_thread_dbutils.serialize_metadata(meta)
+            loaded[sys.intern(lowercase_name)] = rec
+        # one update so queries on the main thread see either none or all of the loaded topics
+        self.topics.update(loaded)
+        self._topic_names = tuple(rec.name for rec in self.topics.values())
+        _log.debug("###DEBUG Loaded topics and metadata on start. Len of  topics %s Len of metadata: %s",
+                   len(self.topics), len(topic_meta_map))
+
+    def _lower(self, topic):
+        """
+        Return the lower case form of a topic name, memoized per topic name.
+        :param topic: topic name
+        :return: lower case topic name
+        """
+        try:
+            return self._lowercase_names[topic]
+        except KeyError:
+            if len(self._lowercase_names) >= _LOWERCASE_CACHE_SIZE:
+                self._lowercase_names.clear()
+            # interned so the lookup keys are the same objects as the keys of the topics map
+            lowercase_name = self._lowercase_names[topic] = sys.intern(topic.lower())
+            return lowercase_name
 
     def get_dbfuncts_object(self):
         db_functs_class = sqlutils.get_dbfuncts_class(self.connection['type'])
-        return db_functs_class(self.connection['params'], self.table_names)
+        dbfuncts = db_functs_class(self.connection['params'], self.table_names)
+        self._set_sqlite_pragmas(dbfuncts, _SQLITE_CONNECTION_PRAGMAS)
+        return dbfuncts
+
+    def _set_sqlite_pragmas(self, dbfuncts, pragmas):
+        """
+        Run the given pragmas on the connection of dbfuncts if the historian uses sqlite. A pragma that fails is
+        logged and skipped.
+        """
+        if self.connection['type'] != 'sqlite':
+            return
+        for pragma in pragmas:
+            try:
+                dbfuncts.execute_stmt(pragma)
+            except Exception as e:
+                _log.warning("Unable to set %s on sqlite database: %s", pragma, e)
 
 
 def main(argv=sys.argv):
@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+from volttron.historian.sql import basedb
+from volttron.utils import jsonapi
+
+VALUES = [
+    1,
+    -7,
+    2**70,
+    1.5,
+    1e16,
+    True,
+    False,
+    None,
+    "x",
+    "null",
+    "café ☃",
+    float("nan"),
+    float("inf"),
+    float("-inf"),
+    [1, 2.5, "a"],
+    [1.0, float("nan")],
+    {"a": [float("inf"), 1]},
+    {"units": "F", "tz": "US/Pacific", "type": "float"},
+    {"nested": {"list": [1, {"b": None}]}},
+    {1: "a"},
+]
+
+
+def _same(a, b):
+    """Equality that treats NaN as equal to NaN"""
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    return type(a) is type(b) and a == b
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_encode_decodes_like_jsonapi(value):
+    assert _same(jsonapi.loads(basedb._encode(value)), jsonapi.loads(jsonapi.dumps(value)))
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_dumps_decodes_like_jsonapi(value):
+    assert _same(jsonapi.loads(basedb._dumps(value)), jsonapi.loads(jsonapi.dumps(value)))
+
+
+@pytest.mark.parametrize("value", [float("nan"), [1.0, float("nan")], {"a": [float("inf")]}, "café", None],
+                         ids=repr)
+def test_encode_leaves_null_and_non_ascii_output_to_jsonapi(value):
+    assert basedb._encode(value) == jsonapi.dumps(value)
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_encode_without_orjson(monkeypatch, value):
+    monkeypatch.setattr(basedb, "_orjson_dumps", None)
+    assert basedb._encode(value) == jsonapi.dumps(value)
@@ -0,0 +1,84 @@
+import sys
+import types
+
+import pytest
+
+from volttron.historian.sql import basedb
+
+
+class FakeCursor:
+
+    def __init__(self):
+        self.rowcount = -1
+        self.executemany_calls = []
+
+    def executemany(self, stmt, args):
+        args = list(args)
+        self.executemany_calls.append((stmt, args))
+        self.rowcount = len(args)
+
+
+class FakeComposed:
+    """ Stands in for a psycopg2.sql.Composed statement """
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+    def as_string(self, context):
+        return self.stmt
+
+
+@pytest.fixture
+def execute_values_calls(monkeypatch):
+    calls = []
+
+    def execute_values(cursor, sql, argslist, template=None, page_size=100):
+        # like psycopg2, rowcount only counts the last page sent
+        argslist = list(argslist)
+        calls.append((sql, argslist, template, page_size))
+        cursor.rowcount = len(argslist[-page_size:])
+
+    psycopg2 = types.ModuleType('psycopg2')
+    extras = types.ModuleType('psycopg2.extras')
+    extras.execute_values = execute_values
+    psycopg2.extras = extras
+    monkeypatch.setitem(sys.modules, 'psycopg2', psycopg2)
+    monkeypatch.setitem(sys.modules, 'psycopg2.extras', extras)
+    return calls
+
+
+def test_rowcount_sums_all_pages(execute_values_calls):
+    cursor = FakeCursor()
+    rows = [(i, i) for i in range(2500)]
+    assert basedb._execute_values(cursor, "INSERT INTO data VALUES (%s, %s)", rows) == 2500
+    assert [len(args) for _, args, _, _ in execute_values_calls] == [1000, 1000, 500]
+    assert sum((args for _, args, _, _ in execute_values_calls), []) == rows
+    assert not cursor.executemany_calls
+
+
+def test_composed_statement(execute_values_calls):
+    cursor = FakeCursor()
+    stmt = FakeComposed('INSERT INTO "data" (ts, topic_id) VALUES (%s, %s)')
+    assert basedb._execute_values(cursor, stmt, [(1, 2), (3, 4)]) == 2
+    assert execute_values_calls == [('INSERT INTO "data" (ts, topic_id) VALUES %s', [(1, 2), (3, 4)],
+                                     '(%s, %s)', 1000)]
+
+
+def test_values_row_with_on_conflict_suffix(execute_values_calls):
+    cursor = FakeCursor()
+    stmt = ("INSERT INTO data (ts, topic_id, value_string) VALUES (%s, %s, %s) "
+            "ON CONFLICT (topic_id, ts) DO UPDATE SET value_string = EXCLUDED.value_string")
+    assert basedb._execute_values(cursor, stmt, [(1, 2, '3')]) == 1
+    (sql, args, template, page_size), = execute_values_calls
+    assert sql == ("INSERT INTO data (ts, topic_id, value_string) VALUES %s "
+                   "ON CONFLICT (topic_id, ts) DO UPDATE SET value_string = EXCLUDED.value_string")
+    assert template == '(%s, %s, %s)'
+    assert args == [(1, 2, '3')]
+
+
+def test_falls_back_to_executemany_without_values_row(execute_values_calls):
+    cursor = FakeCursor()
+    stmt = "UPDATE topics SET metadata = %s WHERE topic_id = %s"
+    assert basedb._execute_values(cursor, stmt, [('{}', 1), ('{}', 2)]) == 2
+    assert cursor.executemany_calls == [(stmt, [('{}', 1), ('{}', 2)])]
+    assert not execute_values_calls